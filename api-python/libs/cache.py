@@ -0,0 +1,52 @@
+"""In-process caches shared across the backend."""
+
+import time
+from collections import OrderedDict
+from typing import Generic, Hashable, Optional, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """Bounded mapping whose entries expire ttl seconds after they are set.
+
+    Once maxsize is reached the oldest entry is evicted. Not thread-safe;
+    services use it from the event loop only.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Optional[V] = None) -> Optional[V]:
+        """Return the cached value, or default if missing or expired."""
+        item = self._data.get(key)
+        if item is None:
+            return default
+
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+
+        return value
+
+    def pop(self, key: Hashable, default: Optional[V] = None) -> Optional[V]:
+        """Remove an entry, returning its value (expired or not) or default."""
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        self._data.clear()
+
+    def __setitem__(self, key: Hashable, value: V) -> None:
+        self._data.pop(key, None)
+        self._data[key] = (time.monotonic() + self.ttl, value)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -1,9 +1,28 @@
 """Common utilities shared across the backend."""
 
+import json
+import os
 import re
+import time
+import uuid
 from typing import Any, Optional, List, Dict
 from urllib.parse import urlparse
 
+try:
+    import orjson
+except ImportError:  # optional speedup, stdlib json works the same
+    orjson = None
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers catch one type
+_json_loads = orjson.loads if orjson else json.loads
+
+# Characters that matter when matching braces in JSON text
+_JSON_SCAN = re.compile(r'[{}"\\]')
+
+# Stray control characters LLMs leave inside JSON strings (all of U+0000–U+001F
+# except \t, \n and \r, which strict=False parsing accepts)
+_JSON_CONTROL_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
 
 def detect_source_type(input_text: str) -> str:
     """
@@ -146,6 +165,101 @@ def format_hashtags(tags: List[str], max_count: int = 5) -> str:
     return " ".join(f"#{tag}" for tag in clean_tags[:max_count])
 
 
+def uuid7() -> uuid.UUID:
+    """
+    Generate a time-ordered UUID (version 7, RFC 9562).
+    
+    The leading 48 bits are the Unix time in milliseconds, so IDs sort by
+    creation time. Used for row IDs to keep B-tree inserts and storage
+    listings in temporal order, unlike random uuid4 values.
+    
+    Returns:
+        A new version 7 UUID
+    """
+    timestamp_ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), "big")  # 80 random bits
+    
+    value = (timestamp_ms & 0xFFFF_FFFF_FFFF) << 80
+    value |= 0x7 << 76                          # version
+    value |= ((rand >> 62) & 0xFFF) << 64       # rand_a (12 bits)
+    value |= 0b10 << 62                         # RFC 4122 variant
+    value |= rand & ((1 << 62) - 1)             # rand_b (62 bits)
+    return uuid.UUID(int=value)
+
+
+def find_json_object(text: str) -> Optional[str]:
+    """
+    Locate the first JSON object embedded in free text.
+    
+    Scans once from the first "{" to its matching "}", skipping braces
+    inside strings, so prose or a second object after the JSON is ignored.
+    Unbalanced (e.g. truncated) output falls back to the last "}".
+    
+    Args:
+        text: Text that may contain a JSON object
+        
+    Returns:
+        The JSON object's source text, or None if there is none
+    """
+    start = text.find("{")
+    if start < 0:
+        return None
+    
+    depth = 0
+    in_string = False
+    skip_to = 0
+    for match in _JSON_SCAN.finditer(text, start):
+        i = match.start()
+        if i < skip_to:
+            continue
+        
+        char = match.group()
+        if in_string:
+            if char == "\\":
+                skip_to = i + 2  # escaped character
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                return text[start:i + 1]
+    
+    end = text.rfind("}") + 1
+    return text[start:end] if end > start else None
+
+
+def parse_json_object(text: str) -> Dict[str, Any]:
+    """
+    Parse the JSON object in an LLM response.
+    
+    Uses orjson when installed. Invalid control characters (literal
+    newlines, tabs) that Gemini sometimes places inside string values are
+    tolerated.
+    
+    Args:
+        text: Raw LLM response text
+        
+    Returns:
+        Parsed object, or an empty dict if the text contains none
+        
+    Raises:
+        json.JSONDecodeError: If the embedded object is not valid JSON
+    """
+    json_str = find_json_object(text)
+    if json_str is None:
+        return {}
+    
+    try:
+        return _json_loads(json_str)
+    except json.JSONDecodeError:
+        cleaned = _JSON_CONTROL_CHARS.sub("", json_str)
+        return json.loads(cleaned, strict=False)
+
+
 def safe_get(data: Dict[str, Any], *keys: str, default: Any = None) -> Any:
     """
     Safely get nested dictionary values.
@@ -9,6 +9,7 @@ from libs.common import (
     detect_source_type,
     extract_youtube_video_id,
     clean_text,
+    parse_json_object,
     truncate_text,
 )
 
@@ -191,16 +192,7 @@ Respond in this exact JSON format:
 
         try:
             response = self.gemini_client.generate_content(prompt)
-            # Parse JSON from response
-            import json
-            # Try to extract JSON from response
-            text = response.text
-            # Find JSON in response
-            start = text.find("{")
-            end = text.rfind("}") + 1
-            if start >= 0 and end > start:
-                json_str = text[start:end]
-                return json.loads(json_str)
+            return parse_json_object(response.text)
         except Exception as e:
             logger.error(f"Error generating summary: {e}", exc_info=True)
         
@@ -8,7 +8,7 @@ from datetime import datetime, timezone
 from typing import Any, Optional, List, Dict, Tuple
 
 from libs.setup import setup_logging, get_settings
-from libs.common import truncate_text
+from libs.common import parse_json_object, truncate_text, uuid7
 from libs.generation.prompts import (
     PLANNER_PROMPT,
     LINKEDIN_WRITER_PROMPT,
@@ -337,7 +337,7 @@ class GenerationService:
         now = datetime.now(timezone.utc).isoformat()
         
         for img in images:
-            new_image_id = str(uuid.uuid4())
+            new_image_id = str(uuid7())
             try:
                 self.supabase.table("images").insert({
                     "id": new_image_id,
@@ -348,6 +348,8 @@ class GenerationService:
                     "storage_path": img.get("storage_path", ""),
                     "aspect_ratio": img.get("aspect_ratio", "1:1"),
                     "style": img.get("style", "infographic"),
+                    "prompt_source": img.get("prompt_source", "legacy"),
+                    "scene_key": img.get("scene_key"),
                     "created_at": now
                 }).execute()
             except Exception as e:
@@ -395,7 +397,7 @@ class GenerationService:
                 feedback=feedback.strip()
             )
             
-            response = self.gemini.generate_content(prompt)
+            response = await self.gemini.generate_content_async(prompt)
             result_data = self._parse_json_response(response.text)
             new_content = result_data.get("rewritten")
         else:
@@ -419,7 +421,7 @@ class GenerationService:
             )
             
             # Generate
-            response = self.gemini.generate_content(prompt)
+            response = await self.gemini.generate_content_async(prompt)
             result_data = self._parse_json_response(response.text)
             
             # Extract new content based on action
@@ -484,7 +486,7 @@ class GenerationService:
         now = datetime.now(timezone.utc).isoformat()
         
         for url in image_urls:
-            image_id = str(uuid.uuid4())
+            image_id = str(uuid7())
             try:
                 self.supabase.table("images").insert({
                     "id": image_id,
@@ -562,10 +564,9 @@ class GenerationService:
             "workspace_id", workspace_id
         ).eq("platform", platform).eq("is_active", True).limit(3).execute()
         
-        examples = []
-        for post in result.data or []:
-            examples.append(post.get("content_md", ""))
-        context["example_posts"] = "\n\n---\n\n".join(examples)
+        context["example_posts"] = "\n\n---\n\n".join(
+            post.get("content_md", "") for post in result.data or []
+        )
         
         return context
     
@@ -579,13 +580,14 @@ class GenerationService:
     ) -> Dict[str, Any]:
         """Run the planner pass to decide angle and structure."""
         # Format sources for prompt
-        sources_text = ""
+        parts = []
         for s in sources[:5]:
-            sources_text += f"\n---\nID: {s['id']}\nTitle: {s.get('title', 'Untitled')}\n"
+            parts.append(f"\n---\nID: {s['id']}\nTitle: {s.get('title', 'Untitled')}\n")
             if s.get("summary"):
-                sources_text += f"Summary: {s['summary']}\n"
+                parts.append(f"Summary: {s['summary']}\n")
             if s.get("key_points"):
-                sources_text += f"Key Points: {', '.join(s['key_points'])}\n"
+                parts.append(f"Key Points: {', '.join(s['key_points'])}\n")
+        sources_text = "".join(parts)
         
         # Build funnel stage context
         funnel_context = ""
@@ -611,7 +613,7 @@ class GenerationService:
             funnel_stage_context=funnel_context
         )
         
-        response = self.gemini.generate_content(prompt)
+        response = await self.gemini.generate_content_async(prompt)
         plan = self._parse_json_response(response.text)
         
         # Override angle if specified
@@ -636,7 +638,7 @@ class GenerationService:
             example_posts=context.get("example_posts", "No examples available")
         )
         
-        response = self.gemini.generate_content(prompt)
+        response = await self.gemini.generate_content_async(prompt)
         result = self._parse_json_response(response.text)
         
         variants = result.get("variants", [])
@@ -740,7 +742,7 @@ class GenerationService:
             tone_of_voice=context.get("tone_of_voice", "")
         )
         
-        response = self.gemini.generate_content(prompt)
+        response = await self.gemini.generate_content_async(prompt)
         return self._parse_json_response(response.text)
     
     async def _save_draft(
@@ -782,27 +784,9 @@ class GenerationService:
         return draft_id
     
     def _parse_json_response(self, text: str) -> Dict[str, Any]:
-        """Parse JSON from LLM response.
-
-        Handles invalid control characters (literal newlines, tabs) that
-        Gemini sometimes places inside JSON string values.
-        """
+        """Parse JSON from LLM response (see parse_json_object)."""
         try:
-            # Find JSON in response
-            start = text.find("{")
-            end = text.rfind("}") + 1
-            if start >= 0 and end > start:
-                json_str = text[start:end]
-                try:
-                    return json.loads(json_str)
-                except json.JSONDecodeError:
-                    # Strip control chars (U+0000–U+001F) except valid
-                    # JSON whitespace (\n, \r, \t) which we replace with
-                    # a space so string values stay readable.
-                    cleaned = re.sub(r"[\x00-\x08\x0b\x0c\x0e-\x1f]", "", json_str)
-                    # Also escape literal newlines/tabs inside string values
-                    # by doing a strict=False parse
-                    return json.loads(cleaned, strict=False)
+            return parse_json_object(text)
         except json.JSONDecodeError as e:
             logger.warning(f"Failed to parse JSON response: {e}")
         
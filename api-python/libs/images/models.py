@@ -68,4 +68,5 @@ class ImageResponse(BaseModel):
     storage_path: str
     aspect_ratio: str
     style: Optional[str]
+    prompt_source: Optional[Literal["scene", "user", "legacy"]] = None
     created_at: str
@@ -1,24 +1,51 @@
 """Image generation service using Gemini 3 Pro Image."""
 
 import io
-import uuid
 import asyncio
+import hashlib
+import threading
+from functools import lru_cache
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Optional, Dict, List
+from typing import Any, Optional, Dict, List, Tuple
 
+import httpx
 from PIL import Image as PILImage
 
 from google import genai
 from google.genai import types
 
-from libs.setup import setup_logging, get_settings
+from libs.setup import sb_execute, setup_logging, get_settings
+from libs.cache import TTLCache
+from libs.common import uuid7
 
 logger = setup_logging(__name__)
 
 # Path to the brand logo (PNG with transparent background)
 LOGO_PATH = Path(__file__).parent.parent.parent / "assets" / "aerie_logo_red.png"
 
+# Checked once: the logo is a packaged asset and doesn't appear at runtime
+_LOGO_EXISTS = LOGO_PATH.exists()
+if not _LOGO_EXISTS:
+    logger.warning(f"Logo not found at {LOGO_PATH}, images will be generated without it")
+
+# Shared google-genai client, created on first use (see _get_genai_client)
+_GENAI_LOCK = threading.Lock()
+_GENAI_CLIENT: Optional[genai.Client] = None
+# Its async transport; google-genai leaves closing a custom client to us
+_GENAI_HTTP: Optional[httpx.AsyncClient] = None
+# Keeps batches from sending more image requests than the API allows. Module
+# level so the images and generation apps share one IMAGE_MAX_CONCURRENCY cap.
+_IMAGE_SEMAPHORE = asyncio.Semaphore(max(1, get_settings().image_max_concurrency))
+
+# Logo assets, built once on first use (see _get_logo_assets)
+_LOGO_LOCK = threading.Lock()
+_LOGO_PART: Optional[types.Part] = None
+_LOGO_RGBA: Optional[PILImage.Image] = None
+
+# Logo resized for the PIL overlay, keyed by target width
+_LOGO_RESIZED: Dict[int, PILImage.Image] = {}
+
 # Gemini 3 Pro Image model for generation
 IMAGE_MODEL = "gemini-3-pro-image-preview"
 
@@ -30,9 +57,29 @@ SUPPORTED_ASPECT_RATIOS = {
     "1:1", "2:3", "3:2", "3:4", "4:3", "4:5", "5:4", "9:16", "16:9", "21:9",
 }
 
+# Leading bytes of the image formats Gemini returns -> (extension, content type)
+IMAGE_FORMATS = {
+    b"\x89PNG": ("png", "image/png"),
+    b"\xff\xd8\xff": ("jpg", "image/jpeg"),
+    b"RIFF": ("webp", "image/webp"),
+}
+IMAGE_SIGNATURES = tuple(IMAGE_FORMATS)
+
 # Default aspect ratio fallback
 DEFAULT_ASPECT_RATIO = "1:1"
 
+# Appended to the prompt when the logo is passed as an input image
+LOGO_INSTRUCTION = (
+    "\n\nIMPORTANT — BRAND LOGO PLACEMENT: "
+    "The attached image is the brand logo. "
+    "Place it small (roughly 8 % of the image width) in the "
+    "bottom-right corner of the generated image. "
+    "Make sure it does NOT overlap any text, headings, or key "
+    "visual elements. Leave a small margin around it. "
+    "Keep the logo exactly as provided — do not redraw, "
+    "recolor, or distort it."
+)
+
 # ── Style prompts ──────────────────────────────────────────────────────────────
 # Each style is the PRIMARY creative direction. Gemini 3 Pro Image can reason
 # about the content, so we pass the full post + brand + style and let it create
@@ -100,19 +147,21 @@ STYLE_PROMPTS = {
 # ── Scene description prompt ───────────────────────────────────────────────────
 # Gemini Flash reads the post + style + brand and produces a concrete, specific
 # scene description that the image model can execute precisely.
-SCENE_PROMPT = """You are an art director creating a brief for an image that will accompany a social media post.
+#
+# The prompt is split so that everything shared by posts with the same style and
+# brand comes first, and the post itself — the only part that changes per
+# request — comes last. Only prefixes with very long brand guidelines are big
+# enough for a Gemini context cache (see SCENE_CACHE_MIN_CHARS).
+SCENE_PROMPT_PREFIX = """You are an art director creating a brief for an image that will accompany a social media post.
 
 === IMAGE STYLE (the user chose this — follow it strictly) ===
 {style}
 
-=== SOCIAL MEDIA POST (understand the topic — the image must be relevant to this) ===
-{content}
-
 === BRAND VISUAL GUIDELINES ===
 {brand}
 
 YOUR JOB:
-Describe a specific, concrete scene for the image model to generate. Be precise about:
+Describe a specific, concrete scene for the image model to generate for the post that follows. Be precise about:
 - What objects, people, or elements appear in the scene
 - How they are arranged and composed (following the style above)
 - What colors to use (from the brand guidelines)
@@ -128,6 +177,218 @@ RULES:
 
 Respond with ONLY the scene description, nothing else."""
 
+SCENE_PROMPT_CONTENT = """=== SOCIAL MEDIA POST (understand the topic — the image must be relevant to this) ===
+{content}"""
+
+# Brand direction used when a workspace has no brand guidelines
+DEFAULT_BRAND = "Clean, professional, modern aesthetic."
+
+# How long a cached scene prefix lives on Gemini's side
+SCENE_CACHE_TTL_SECONDS = 3600
+
+# Gemini won't create a context cache smaller than this for SCENE_MODEL, so
+# shorter scene prefixes are sent inline. A prefix is ~1.5k characters plus
+# the brand guidelines, so in practice only workspaces with brand documents
+# of ~15k characters or more get a cache. Estimated at ~4 characters/token.
+SCENE_CACHE_MIN_TOKENS = 4096
+SCENE_CACHE_MIN_CHARS = SCENE_CACHE_MIN_TOKENS * 4
+
+# Scene prefix cache key -> Gemini cache name ("" when sent inline); expires
+# locally a little before Gemini drops the cache. Shared by every ImageService.
+_SCENE_CACHE_HANDLES: TTLCache[str] = TTLCache(maxsize=256, ttl=SCENE_CACHE_TTL_SECONDS - 60)
+
+# Rate limits and transient server errors are retried with exponential
+# backoff (1s, 2s, 4s, capped at 16s, plus jitter) before failing the image
+GEMINI_RETRY_OPTIONS = types.HttpRetryOptions(
+    attempts=4,
+    initial_delay=1.0,
+    max_delay=16.0,
+    exp_base=2,
+    jitter=1.0,
+    http_status_codes=[429, 500, 502, 503, 504],
+)
+
+
+def _get_genai_client(api_key: str) -> genai.Client:
+    """Return the process-wide google-genai client, creating it on first use.
+
+    The client owns the HTTP connection pool, so sharing it lets every
+    ImageService reuse open connections instead of paying a new TLS
+    handshake. Its async transport speaks HTTP/2, so concurrent batch
+    requests are multiplexed over a few kept-alive connections. Callers
+    must not close() the shared client; use _close_genai_client on shutdown.
+    """
+    global _GENAI_CLIENT, _GENAI_HTTP
+
+    if _GENAI_CLIENT is None:
+        with _GENAI_LOCK:
+            if _GENAI_CLIENT is None:
+                _GENAI_HTTP = httpx.AsyncClient(
+                    http2=True,
+                    limits=httpx.Limits(
+                        max_connections=32,
+                        max_keepalive_connections=16,
+                        keepalive_expiry=60,
+                    ),
+                )
+                _GENAI_CLIENT = genai.Client(
+                    api_key=api_key,
+                    http_options=types.HttpOptions(
+                        httpx_async_client=_GENAI_HTTP,
+                        retry_options=GEMINI_RETRY_OPTIONS,
+                    ),
+                )
+
+    return _GENAI_CLIENT
+
+
+async def _close_genai_client() -> None:
+    """Close the shared google-genai client and its connection pool."""
+    global _GENAI_CLIENT, _GENAI_HTTP
+
+    with _GENAI_LOCK:
+        client, http = _GENAI_CLIENT, _GENAI_HTTP
+        _GENAI_CLIENT = _GENAI_HTTP = None
+
+    if client is not None:
+        client.close()
+    if http is not None:
+        await http.aclose()
+
+
+@lru_cache(maxsize=None)
+def _make_image_config(aspect_ratio: str) -> types.GenerateContentConfig:
+    """Return the (shared) image generation config for an aspect ratio."""
+    return types.GenerateContentConfig(
+        response_modalities=["IMAGE"],
+        image_config=types.ImageConfig(
+            aspect_ratio=aspect_ratio,
+        ),
+    )
+
+
+@lru_cache(maxsize=64)
+def _make_scene_config(cache_name: Optional[str]) -> types.GenerateContentConfig:
+    """Return the (shared) scene description config, optionally on a context cache.
+
+    Bounded because cache names rotate as Gemini context caches expire.
+    """
+    return types.GenerateContentConfig(
+        response_modalities=["TEXT"],
+        cached_content=cache_name,
+    )
+
+
+def _extract_image_bytes(response: Any) -> Optional[bytes]:
+    """Return the first inline image in a Gemini response, if any.
+
+    Parts are matched on the payload's magic bytes rather than the MIME
+    string, which also skips empty inline parts.
+    """
+    if not response or not response.candidates:
+        return None
+
+    return next(
+        (
+            part.inline_data.data
+            for part in response.candidates[0].content.parts
+            if part.inline_data
+            and part.inline_data.data
+            and part.inline_data.data.startswith(IMAGE_SIGNATURES)
+        ),
+        None,
+    )
+
+
+def _image_format(image_bytes: bytes) -> Tuple[str, str]:
+    """Return (file extension, content type) for generated image bytes."""
+    return next(
+        (fmt for signature, fmt in IMAGE_FORMATS.items() if image_bytes.startswith(signature)),
+        ("png", "image/png"),
+    )
+
+
+def _get_logo_assets() -> Tuple[Optional[types.Part], Optional[PILImage.Image]]:
+    """Return the brand logo as (Gemini input part, RGBA image), built on first use.
+
+    The Gemini part holds the logo pre-encoded as PNG, flattened onto white
+    because Gemini's image input does not reliably handle alpha channels, so
+    requests never re-encode it. The RGBA version keeps the transparency for
+    the PIL overlay. Both are shared — do not mutate them.
+    """
+    global _LOGO_PART, _LOGO_RGBA
+
+    if not _LOGO_EXISTS:
+        return None, None
+
+    if _LOGO_RGBA is None:
+        with _LOGO_LOCK:
+            if _LOGO_RGBA is None:
+                logo = PILImage.open(LOGO_PATH).convert("RGBA")
+
+                # Flatten onto white background so Gemini accepts it
+                background = PILImage.new("RGB", logo.size, (255, 255, 255))
+                background.paste(logo, mask=logo.split()[3])  # alpha channel
+
+                buf = io.BytesIO()
+                background.save(buf, format="PNG", compress_level=1)
+
+                _LOGO_PART = types.Part.from_bytes(data=buf.getvalue(), mime_type="image/png")
+                _LOGO_RGBA = logo
+
+    return _LOGO_PART, _LOGO_RGBA
+
+
+def _get_overlay_logo(max_logo_w: int) -> Optional[PILImage.Image]:
+    """Return the RGBA logo scaled down to at most max_logo_w pixels wide."""
+    _, logo = _get_logo_assets()
+    if logo is None or logo.width <= max_logo_w:
+        return logo
+
+    resized = _LOGO_RESIZED.get(max_logo_w)
+    if resized is None:
+        r = max_logo_w / logo.width
+        # reducing_gap: box-reduce by an integer factor first, then LANCZOS the
+        # remainder — visually identical at 3.0 and much cheaper for big logos
+        resized = logo.resize(
+            (int(logo.width * r), int(logo.height * r)),
+            PILImage.LANCZOS,
+            reducing_gap=3.0,
+        )
+        _LOGO_RESIZED[max_logo_w] = resized
+
+    return resized
+
+
+@lru_cache(maxsize=64)
+def _scene_prefix(style: str, brand: str) -> Tuple[str, str]:
+    """Build the cacheable scene prompt prefix and its cache key.
+
+    Memoized: batches and repeat requests for a workspace reuse the same
+    (style, brand) pair, so the format and hash run once per pair.
+    """
+    style_instruction = STYLE_PROMPTS.get(style, STYLE_PROMPTS["minimal"])
+
+    # Text rule depends on style — flowcharts and infographics benefit from labels
+    if style in STYLES_WITH_TEXT:
+        text_rule = (
+            "- You MAY include short text labels (2-4 words each) on diagram elements "
+            "like steps, sections, or data points. Keep labels minimal and readable."
+        )
+    else:
+        text_rule = (
+            "- Do NOT include any text, words, letters, numbers, or labels in the scene. "
+            "The image should be purely visual."
+        )
+
+    prefix = SCENE_PROMPT_PREFIX.format(
+        style=style_instruction,
+        brand=brand,
+        text_rule=text_rule,
+    )
+    cache_key = f"{style}:{hashlib.sha256(prefix.encode()).hexdigest()[:16]}"
+    return prefix, cache_key
+
 
 class ImageService:
     """Service for generating images using Gemini 3 Pro Image."""
@@ -145,7 +406,7 @@ class ImageService:
         # Initialize google-genai client using the Gemini API key
         if self.settings.gemini_api_key:
             try:
-                self.genai_client = genai.Client(api_key=self.settings.gemini_api_key)
+                self.genai_client = _get_genai_client(self.settings.gemini_api_key)
                 logger.info("Gemini 3 Pro Image initialized")
             except Exception as e:
                 logger.error(f"Failed to initialize genai client: {e}", exc_info=True)
@@ -157,6 +418,34 @@ class ImageService:
         """Check whether the image generation backend is ready."""
         return self.genai_client is not None
 
+    async def warmup(self) -> None:
+        """Pay one-time startup costs before the first request arrives.
+
+        Decodes the logo and opens the Gemini connection. Failures are logged
+        and left to the lazy paths to retry.
+        """
+        try:
+            await asyncio.to_thread(_get_logo_assets)
+        except Exception as e:
+            logger.warning(f"Logo warmup failed: {e}")
+
+        if not self.genai_client:
+            return
+
+        try:
+            # Fetching the first page of models is enough to complete the TLS handshake
+            await self.genai_client.aio.models.list()
+        except Exception as e:
+            logger.warning(f"Gemini warmup failed: {e}")
+            return
+
+        logger.info("Image service warmed up")
+
+    async def aclose(self) -> None:
+        """Release the Gemini connection pool on shutdown."""
+        self.genai_client = None
+        await _close_genai_client()
+
     async def generate_batch_images(
         self,
         draft_id: str,
@@ -169,30 +458,69 @@ class ImageService:
         if not styles:
             styles = ["infographic", "comparison"][:count]
 
-        while len(styles) < count:
-            styles.append(styles[-1] if styles else "infographic")
+        # Pad with the last style (without touching the caller's list) and trim
+        styles = (styles + [styles[-1] if styles else "infographic"] * (count - len(styles)))[:count]
+
+        if not self.genai_client:
+            raise ValueError("Image generation not configured - check GEMINI_API_KEY")
+
+        draft, brand_guidelines = await self._fetch_image_context(draft_id)
 
-        # Generate images in parallel
-        tasks = [
-            self.generate_image(
-                draft_id=draft_id,
-                aspect_ratio=aspect_ratio,
-                style=styles[i],
-                include_logo=include_logo
+        # One scene brief per distinct style — repeated styles share it
+        # instead of each making the same Gemini Flash call
+        unique_styles = list(dict.fromkeys(styles))
+        scenes = await asyncio.gather(*(
+            self._build_scene_prompt(
+                workspace_id=draft["workspace_id"],
+                content=draft["content_text"],
+                brand_guidelines=brand_guidelines,
+                style=style,
+                reuse_stored=True,
             )
-            for i in range(count)
-        ]
+            for style in unique_styles
+        ))
+        scene_by_style = dict(zip(unique_styles, scenes))
+
+        # Generate and upload images in parallel; the batch shares the draft
+        # it already fetched and one timestamp
+        created_at = datetime.now(timezone.utc).isoformat()
+        async def generate(style: str) -> Optional[Dict[str, Any]]:
+            # Failures are caught per image so one bad generation doesn't
+            # cancel the rest of the task group
+            scene, scene_key = scene_by_style[style]
+            try:
+                row, image_data = await self._render_image(
+                    draft_id=draft_id,
+                    draft=draft,
+                    brand_guidelines=brand_guidelines,
+                    aspect_ratio=aspect_ratio,
+                    style=style,
+                    custom_prompt=scene,
+                    include_logo=include_logo,
+                    prompt_source="scene",
+                    scene_key=scene_key,
+                    created_at=created_at,
+                )
+                await self._sb_upload(row["storage_path"], image_data, _image_format(image_data)[1])
+                return row
+            except Exception as e:
+                logger.error(f"Image generation failed: {e}")
+                return None
+
+        async with asyncio.TaskGroup() as tg:
+            tasks = [tg.create_task(generate(style)) for style in styles]
 
-        results = await asyncio.gather(*tasks, return_exceptions=True)
+        rows = [task.result() for task in tasks if task.result()]
 
-        images = []
-        for result in results:
-            if isinstance(result, Exception):
-                logger.error(f"Image generation failed: {result}")
-            elif result:
-                images.append(result)
+        # Record the whole batch with one insert instead of one per image
+        if rows:
+            try:
+                await sb_execute(self.supabase.table("images").insert(rows))
+            except Exception:
+                await self._remove_uploads([row["storage_path"] for row in rows])
+                raise
 
-        return {"draft_id": draft_id, "images": images}
+        return {"draft_id": draft_id, "images": [self._image_result(row) for row in rows]}
 
     async def generate_image(
         self,
@@ -200,35 +528,126 @@ class ImageService:
         aspect_ratio: str = "1:1",
         style: str = "infographic",
         custom_prompt: Optional[str] = None,
-        include_logo: bool = True
+        include_logo: bool = True,
     ) -> Dict[str, Any]:
         """Generate an image for a draft using Gemini 3 Pro Image."""
-        if not self.supabase:
-            raise ValueError("Database not configured")
-
         if not self.genai_client:
             raise ValueError("Image generation not configured - check GEMINI_API_KEY")
 
-        # Fetch the draft
-        result = self.supabase.table("drafts").select("*").eq("id", draft_id).single().execute()
-        draft = result.data
+        brand_guidelines = ""
+        if custom_prompt:
+            draft = await self._fetch_draft(draft_id)
+        else:
+            # The scene brief needs the brand guidelines too; this fetches
+            # them with the draft in one round-trip
+            draft, brand_guidelines = await self._fetch_image_context(draft_id)
+
+        return await self._generate_image_with_context(
+            draft_id=draft_id,
+            draft=draft,
+            brand_guidelines=brand_guidelines,
+            aspect_ratio=aspect_ratio,
+            style=style,
+            custom_prompt=custom_prompt,
+            include_logo=include_logo,
+            prompt_source=None,
+            scene_key=None,
+            created_at=None,
+        )
 
-        if not draft:
-            raise ValueError("Draft not found")
+    # ── Private helpers ────────────────────────────────────────────────────────
 
-        workspace_id = draft["workspace_id"]
+    async def _generate_image_with_context(
+        self,
+        draft_id: str,
+        draft: Dict[str, Any],
+        brand_guidelines: str,
+        aspect_ratio: str,
+        style: str,
+        custom_prompt: Optional[str],
+        include_logo: bool,
+        prompt_source: Optional[str],
+        scene_key: Optional[str],
+        created_at: Optional[str],
+    ) -> Dict[str, Any]:
+        """Generate, store and record one image for an already-fetched draft."""
+        row, image_data = await self._render_image(
+            draft_id=draft_id,
+            draft=draft,
+            brand_guidelines=brand_guidelines,
+            aspect_ratio=aspect_ratio,
+            style=style,
+            custom_prompt=custom_prompt,
+            include_logo=include_logo,
+            prompt_source=prompt_source,
+            scene_key=scene_key,
+            created_at=created_at,
+        )
 
-        # Get brand guidelines
-        brand_guidelines = await self._get_brand_guidelines(workspace_id)
+        # Upload to Supabase Storage and save to database concurrently — the
+        # row only references the storage path, not the uploaded object
+        upload_result, insert_result = await asyncio.gather(
+            self._sb_upload(row["storage_path"], image_data, _image_format(image_data)[1]),
+            sb_execute(self.supabase.table("images").insert(row)),
+            return_exceptions=True,
+        )
+
+        upload_failed = isinstance(upload_result, BaseException)
+        insert_failed = isinstance(insert_result, BaseException)
+        if upload_failed or insert_failed:
+            await self._discard_partial_image(
+                row["id"],
+                row["storage_path"],
+                uploaded=not upload_failed,
+                inserted=not insert_failed,
+            )
+            raise upload_result if upload_failed else insert_result
+
+        return self._image_result(row)
+
+    async def _render_image(
+        self,
+        draft_id: str,
+        draft: Dict[str, Any],
+        brand_guidelines: str,
+        aspect_ratio: str,
+        style: str,
+        custom_prompt: Optional[str],
+        include_logo: bool,
+        prompt_source: Optional[str],
+        scene_key: Optional[str],
+        created_at: Optional[str],
+    ) -> Tuple[Dict[str, Any], bytes]:
+        """Generate one image without storing it.
+
+        brand_guidelines is only used to build a scene brief when there is no
+        custom_prompt.
+
+        prompt_source is stored with the image; it defaults to 'user' when
+        custom_prompt is given and is 'scene' otherwise. scene_key marks a
+        custom_prompt that is really a scene brief so it stays discoverable
+        for reuse (see _build_scene_prompt). created_at lets batch callers
+        stamp all their rows with one ISO timestamp; it defaults to now.
+
+        Returns the images row to record and the image bytes to upload to the
+        row's storage_path. The bytes are PNG, JPEG or WebP as Gemini (or the
+        logo overlay) produced them; the path's extension matches, and
+        _image_format gives the upload's content type.
+        """
+        workspace_id = draft["workspace_id"]
 
         # Build the prompt — use Gemini Flash to create a specific scene description
         if custom_prompt:
             image_prompt = custom_prompt
+            prompt_source = prompt_source or "user"
         else:
-            image_prompt = await self._build_scene_prompt(
+            prompt_source = "scene"
+            image_prompt, scene_key = await self._build_scene_prompt(
+                workspace_id=workspace_id,
                 content=draft["content_text"],
                 brand_guidelines=brand_guidelines,
                 style=style,
+                reuse_stored=False,
             )
 
         # Generate the image (pass logo so Gemini places it natively)
@@ -239,51 +658,66 @@ class ImageService:
         if not image_data:
             raise ValueError("Image generation failed")
 
-        # Upload to Supabase Storage
-        image_id = str(uuid.uuid4())
-        storage_path = f"images/{workspace_id}/{image_id}.png"
-
-        self.supabase.storage.from_("generated-images").upload(
-            storage_path,
-            image_data,
-            {"content-type": "image/png"}
-        )
-
-        # Get public URL
-        public_url = self.supabase.storage.from_("generated-images").get_public_url(storage_path)
-
-        # Save to database
-        now = datetime.now(timezone.utc).isoformat()
-        self.supabase.table("images").insert({
+        image_id = str(uuid7())
+        extension = _image_format(image_data)[0]
+        row = {
             "id": image_id,
             "workspace_id": workspace_id,
             "draft_id": draft_id,
             "prompt": image_prompt,
             "model": IMAGE_MODEL,
-            "storage_path": storage_path,
+            "storage_path": f"images/{workspace_id}/{image_id}.{extension}",
             "aspect_ratio": aspect_ratio,
             "style": style,
-            "created_at": now
-        }).execute()
+            "prompt_source": prompt_source,
+            "scene_key": scene_key,
+            "created_at": created_at or datetime.now(timezone.utc).isoformat()
+        }
+        return row, image_data
+
+    def _image_result(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Shape an images row into the result returned to API callers."""
+        # Public URLs are derived from the path, so no request is made
+        public_url = self.supabase.storage.from_("generated-images").get_public_url(
+            row["storage_path"]
+        )
 
         return {
-            "image_id": image_id,
-            "draft_id": draft_id,
-            "prompt": image_prompt,
-            "storage_path": storage_path,
+            "image_id": row["id"],
+            "draft_id": row["draft_id"],
+            "prompt": row["prompt"],
+            "storage_path": row["storage_path"],
             "url": public_url,
-            "aspect_ratio": aspect_ratio,
-            "style": style
+            "aspect_ratio": row["aspect_ratio"],
+            "style": row["style"],
+            "prompt_source": row["prompt_source"],
+            "scene_key": row["scene_key"]
         }
 
-    # ── Private helpers ────────────────────────────────────────────────────────
+    async def _call_image_model(
+        self, contents: list, config: types.GenerateContentConfig
+    ) -> Any:
+        """Send an image model request, bounded by IMAGE_MAX_CONCURRENCY."""
+        async with _IMAGE_SEMAPHORE:
+            return await self.genai_client.aio.models.generate_content(
+                model=IMAGE_MODEL,
+                contents=contents,
+                config=config,
+            )
+
+    async def _sb_upload(self, path: str, data: bytes, content_type: str) -> None:
+        """Upload a file to the generated-images bucket in a worker thread."""
+        bucket = self.supabase.storage.from_("generated-images")
+        await asyncio.to_thread(bucket.upload, path, data, {"content-type": content_type})
 
     async def _build_scene_prompt(
         self,
+        workspace_id: str,
         content: str,
         brand_guidelines: str,
         style: str,
-    ) -> str:
+        reuse_stored: bool,
+    ) -> Tuple[str, Optional[str]]:
         """Use Gemini Flash to create a specific scene description.
 
         Pipeline:
@@ -292,45 +726,48 @@ class ImageService:
 
         This produces images that are specific to the post content
         rather than generic/abstract interpretations.
+
+        Returns (scene, scene_key). Scene briefs are stored with their key on
+        the images table. With reuse_stored, a brief the workspace already
+        generated for the same style, post and brand is reused without
+        calling Flash; single generations pass False so asking again gives a
+        fresh brief. The key is None for the fallback prompt, which shouldn't
+        be reused.
         """
         style_instruction = STYLE_PROMPTS.get(style, STYLE_PROMPTS["minimal"])
-        brand = brand_guidelines.strip() if brand_guidelines else "Clean, professional, modern aesthetic."
 
-        # Text rule depends on style — flowcharts and infographics benefit from labels
-        if style in STYLES_WITH_TEXT:
-            text_rule = (
-                "- You MAY include short text labels (2-4 words each) on diagram elements "
-                "like steps, sections, or data points. Keep labels minimal and readable."
-            )
-        else:
-            text_rule = (
-                "- Do NOT include any text, words, letters, numbers, or labels in the scene. "
-                "The image should be purely visual."
-            )
+        brand = brand_guidelines.strip() if brand_guidelines else DEFAULT_BRAND
+
+        scene_key = self._scene_key(style, content, brand)
+        stored_scene = (
+            await self._find_stored_scene(workspace_id, scene_key) if reuse_stored else None
+        )
+        if stored_scene:
+            logger.info(f"Reusing stored scene description (style={style}, key={scene_key})")
+            return stored_scene, scene_key
 
         # Ask Gemini Flash to describe the scene
         if self.genai_client:
-            try:
-                scene_request = SCENE_PROMPT.format(
-                    style=style_instruction,
-                    content=content,
-                    brand=brand,
-                    text_rule=text_rule,
-                )
+            prefix, cache_key = _scene_prefix(style, brand)
+            post = SCENE_PROMPT_CONTENT.format(content=content)
 
-                response = await asyncio.to_thread(
-                    self.genai_client.models.generate_content,
-                    model=SCENE_MODEL,
-                    contents=[scene_request],
-                    config=types.GenerateContentConfig(
-                        response_modalities=["TEXT"],
-                    ),
-                )
+            try:
+                cache_name = await self._get_scene_cache(cache_key, prefix)
+                try:
+                    response = await self._request_scene(prefix, post, cache_name)
+                except Exception as e:
+                    if not cache_name:
+                        raise
+                    # The server-side cache may have expired; forget it and
+                    # retry once with the prefix inline
+                    _SCENE_CACHE_HANDLES.pop(cache_key, None)
+                    logger.info(f"Cached scene request failed, retrying inline: {e}")
+                    response = await self._request_scene(prefix, post, None)
 
                 if response and response.text:
                     scene = response.text.strip()
                     logger.info(f"Scene description ({len(scene)} chars, style={style}): {scene[:120]}...")
-                    return scene
+                    return scene, scene_key
 
             except Exception as e:
                 logger.warning(f"Scene description failed, using fallback: {e}")
@@ -340,70 +777,181 @@ class ImageService:
             f"{style_instruction} "
             f"The image is about: {content[:300]}. "
             f"No text, words, letters, or numbers in the image."
+        ), None
+
+    async def _request_scene(
+        self, prefix: str, post: str, cache_name: Optional[str]
+    ) -> Any:
+        """Ask Gemini Flash for a scene brief, reusing a cached prefix if given."""
+        contents = [post] if cache_name else [f"{prefix}\n\n{post}"]
+        return await self.genai_client.aio.models.generate_content(
+            model=SCENE_MODEL,
+            contents=contents,
+            config=_make_scene_config(cache_name),
         )
 
-    async def _get_brand_guidelines(self, workspace_id: str) -> str:
-        """Get brand guidelines from KB documents."""
-        try:
-            result = self.supabase.table("kb_documents").select("content_md").eq(
-                "workspace_id", workspace_id
-            ).eq("key", "brand_guidelines").eq("is_active", True).limit(1).execute()
+    @staticmethod
+    def _scene_key(style: str, content: str, brand: str) -> str:
+        """Derive the persistent cache key for a scene brief."""
+        content_hash = hashlib.sha256(content.encode()).hexdigest()
+        brand_hash = hashlib.sha256(brand.encode()).hexdigest()
+        return hashlib.blake2b(
+            f"{style}|{content_hash}|{brand_hash}".encode(), digest_size=16
+        ).hexdigest()
+
+    async def _find_stored_scene(self, workspace_id: str, scene_key: str) -> Optional[str]:
+        """Look up a scene brief the workspace already generated for the same inputs."""
+        if not self.supabase:
+            return None
 
-            if result.data and len(result.data) > 0:
-                return result.data[0].get("content_md", "")
+        try:
+            result = await sb_execute(
+                self.supabase.table("images").select("prompt").eq(
+                    "workspace_id", workspace_id
+                ).eq("scene_key", scene_key).limit(1)
+            )
+            if result.data:
+                return result.data[0].get("prompt")
         except Exception as e:
-            logger.debug(f"No brand guidelines found: {e}")
+            logger.debug(f"Stored scene lookup failed: {e}")
+
+        return None
+
+    async def _fetch_draft(self, draft_id: str) -> Dict[str, Any]:
+        """Fetch a draft row, raising ValueError if it can't be loaded."""
+        if not self.supabase:
+            raise ValueError("Database not configured")
+
+        result = await sb_execute(
+            self.supabase.table("drafts").select("*").eq("id", draft_id).single()
+        )
+        draft = result.data
 
-        return ""
+        if not draft:
+            raise ValueError("Draft not found")
 
-    def _load_logo(self) -> Optional[PILImage.Image]:
-        """Load the brand logo as an RGB PIL Image for passing to Gemini.
+        return draft
 
-        Converts RGBA → RGB (white background) because Gemini's image input
-        does not reliably handle alpha channels.
+    async def _fetch_image_context(self, draft_id: str) -> Tuple[Dict[str, Any], str]:
+        """Fetch a draft and its workspace's brand guidelines in one round-trip.
+
+        Uses the get_image_context RPC. Raises ValueError like _fetch_draft.
         """
+        if not self.supabase:
+            raise ValueError("Database not configured")
+
+        result = await sb_execute(
+            self.supabase.rpc("get_image_context", {"p_draft_id": draft_id})
+        )
+        context = result.data
+
+        if not context or not context.get("draft"):
+            raise ValueError("Draft not found")
+
+        draft = context["draft"]
+        return draft, context.get("brand_guidelines") or ""
+
+    async def _discard_partial_image(
+        self,
+        image_id: str,
+        storage_path: str,
+        uploaded: bool,
+        inserted: bool,
+    ) -> None:
+        """Best-effort cleanup when only one of upload/insert succeeded."""
+        if inserted:
+            try:
+                await sb_execute(self.supabase.table("images").delete().eq("id", image_id))
+            except Exception as e:
+                logger.warning(f"Failed to clean up partial image {image_id}: {e}")
+        if uploaded:
+            await self._remove_uploads([storage_path])
+
+    async def _remove_uploads(self, storage_paths: List[str]) -> None:
+        """Best-effort removal of uploaded images that won't be recorded."""
         try:
-            if not LOGO_PATH.exists():
-                logger.warning(f"Logo not found at {LOGO_PATH}, skipping")
-                return None
+            bucket = self.supabase.storage.from_("generated-images")
+            await asyncio.to_thread(bucket.remove, storage_paths)
+        except Exception as e:
+            logger.warning(f"Failed to remove uploaded images {storage_paths}: {e}")
 
-            logo = PILImage.open(LOGO_PATH)
+    async def _get_scene_cache(self, cache_key: str, prefix: str) -> Optional[str]:
+        """Return the name of a Gemini context cache holding the scene prefix.
 
-            # Flatten RGBA onto white background so Gemini accepts it
-            if logo.mode == "RGBA":
-                background = PILImage.new("RGB", logo.size, (255, 255, 255))
-                background.paste(logo, mask=logo.split()[3])  # alpha channel
-                return background
+        Only prefixes of at least SCENE_CACHE_MIN_CHARS qualify, which in
+        practice means very long brand guidelines; every other request gets
+        None without any API call and sends the prefix inline. Qualifying
+        caches are created lazily per (style, brand) and reused until their
+        TTL runs out. Also returns None when cache creation fails.
+        """
+        if len(prefix) < SCENE_CACHE_MIN_CHARS:
+            return None
+
+        handle = _SCENE_CACHE_HANDLES.get(cache_key)
+        if handle is not None:
+            return handle or None
+
+        cache_name: Optional[str] = None
+        try:
+            cache = await self.genai_client.aio.caches.create(
+                model=SCENE_MODEL,
+                config=types.CreateCachedContentConfig(
+                    contents=[prefix],
+                    ttl=f"{SCENE_CACHE_TTL_SECONDS}s",
+                ),
+            )
+            cache_name = cache.name
+            logger.info(f"Created scene prompt cache {cache_name} ({cache_key})")
+        except Exception as e:
+            logger.debug(f"Scene prompt cache unavailable, sending prefix inline: {e}")
+
+        _SCENE_CACHE_HANDLES[cache_key] = cache_name or ""
+        return cache_name
 
-            return logo.convert("RGB")
+    def _load_logo(self) -> Optional[types.Part]:
+        """Load the brand logo as a PNG part for passing to Gemini."""
+        try:
+            return _get_logo_assets()[0]
         except Exception as e:
             logger.warning(f"Failed to load logo: {e}")
             return None
 
     def _overlay_logo_pil(self, image_bytes: bytes) -> bytes:
-        """Fallback: overlay logo via PIL when Gemini input approach fails."""
+        """Fallback: overlay logo via PIL when Gemini input approach fails.
+
+        JPEG output stays JPEG; everything else is written as PNG.
+        """
         try:
-            if not LOGO_PATH.exists():
+            if _get_logo_assets()[1] is None:
                 return image_bytes
 
-            base = PILImage.open(io.BytesIO(image_bytes)).convert("RGBA")
-            logo = PILImage.open(LOGO_PATH).convert("RGBA")
+            base = PILImage.open(io.BytesIO(image_bytes))
+            is_jpeg = base.format == "JPEG"
+            if base.mode not in ("RGB", "RGBA"):
+                base = base.convert("RGB" if is_jpeg else "RGBA")
 
             # Scale logo to ~8 % of image width
-            max_logo_w = int(base.width * 0.08)
-            if logo.width > max_logo_w:
-                r = max_logo_w / logo.width
-                logo = logo.resize(
-                    (int(logo.width * r), int(logo.height * r)),
-                    PILImage.LANCZOS,
-                )
+            logo = _get_overlay_logo(int(base.width * 0.08))
 
-            # Bottom-right with 3 % padding
+            # Bottom-right with 3 % padding. Only the logo's footprint is
+            # promoted to RGBA for compositing; the rest keeps its own mode.
             pad = int(base.width * 0.03)
-            base.paste(logo, (base.width - logo.width - pad, base.height - logo.height - pad), logo)
+            x = base.width - logo.width - pad
+            y = base.height - logo.height - pad
+            box = (x, y, x + logo.width, y + logo.height)
 
+            region = base.crop(box).convert("RGBA")
+            region.alpha_composite(logo)
+            base.paste(region if base.mode == "RGBA" else region.convert(base.mode), box)
+
+            # The output goes straight to storage, so favour encode speed over
+            # size — level 1 is several times faster than zlib's default of 6.
+            # Re-encoding a JPEG as PNG would only make it several times bigger.
             out = io.BytesIO()
-            base.save(out, format="PNG")
+            if is_jpeg:
+                base.save(out, format="JPEG", quality=95)
+            else:
+                base.save(out, format="PNG", compress_level=1, optimize=False)
             logger.info("Brand logo overlaid via PIL fallback")
             return out.getvalue()
         except Exception as e:
@@ -427,41 +975,20 @@ class ImageService:
             return None
 
         ratio = aspect_ratio if aspect_ratio in SUPPORTED_ASPECT_RATIOS else DEFAULT_ASPECT_RATIO
-        logo_image = self._load_logo() if include_logo else None
+        logo_part = self._load_logo() if include_logo else None
 
         # ── Attempt 1: pass logo as input image so Gemini places it ──────
-        if logo_image:
+        if logo_part:
             try:
-                logo_instruction = (
-                    "\n\nIMPORTANT — BRAND LOGO PLACEMENT: "
-                    "The attached image is the brand logo. "
-                    "Place it small (roughly 8 % of the image width) in the "
-                    "bottom-right corner of the generated image. "
-                    "Make sure it does NOT overlap any text, headings, or key "
-                    "visual elements. Leave a small margin around it. "
-                    "Keep the logo exactly as provided — do not redraw, "
-                    "recolor, or distort it."
-                )
-                contents: list = [prompt + logo_instruction, logo_image]
+                contents: list = [prompt + LOGO_INSTRUCTION, logo_part]
                 logger.info(f"Generating image with {IMAGE_MODEL} ({ratio}) + logo")
 
-                response = await asyncio.to_thread(
-                    self.genai_client.models.generate_content,
-                    model=IMAGE_MODEL,
-                    contents=contents,
-                    config=types.GenerateContentConfig(
-                        response_modalities=["IMAGE"],
-                        image_config=types.ImageConfig(
-                            aspect_ratio=ratio,
-                        ),
-                    ),
-                )
+                response = await self._call_image_model(contents, _make_image_config(ratio))
 
-                if response and response.candidates:
-                    for part in response.candidates[0].content.parts:
-                        if part.inline_data and part.inline_data.mime_type.startswith("image/"):
-                            logger.info(f"Generated image with logo ({len(part.inline_data.data)} bytes)")
-                            return part.inline_data.data
+                image_bytes = _extract_image_bytes(response)
+                if image_bytes:
+                    logger.info(f"Generated image with logo ({len(image_bytes)} bytes)")
+                    return image_bytes
 
                 logger.warning("No image data in logo response, falling back")
             except Exception as e:
@@ -471,27 +998,16 @@ class ImageService:
         try:
             logger.info(f"Generating image with {IMAGE_MODEL} ({ratio})")
 
-            response = await asyncio.to_thread(
-                self.genai_client.models.generate_content,
-                model=IMAGE_MODEL,
-                contents=[prompt],
-                config=types.GenerateContentConfig(
-                    response_modalities=["IMAGE"],
-                    image_config=types.ImageConfig(
-                        aspect_ratio=ratio,
-                    ),
-                ),
-            )
+            response = await self._call_image_model([prompt], _make_image_config(ratio))
 
-            if response and response.candidates:
-                for part in response.candidates[0].content.parts:
-                    if part.inline_data and part.inline_data.mime_type.startswith("image/"):
-                        image_bytes = part.inline_data.data
-                        logger.info(f"Generated image ({len(image_bytes)} bytes)")
-                        # Apply PIL overlay as fallback when logo was requested
-                        if include_logo:
-                            image_bytes = self._overlay_logo_pil(image_bytes)
-                        return image_bytes
+            image_bytes = _extract_image_bytes(response)
+            if image_bytes:
+                logger.info(f"Generated image ({len(image_bytes)} bytes)")
+                # Apply PIL overlay as fallback when logo was requested.
+                # Decode/resize/encode is CPU-bound, so keep it off the loop.
+                if include_logo:
+                    image_bytes = await asyncio.to_thread(self._overlay_logo_pil, image_bytes)
+                return image_bytes
 
             logger.warning("No image data in response")
             return None
@@ -501,19 +1017,40 @@ class ImageService:
             return None
 
     async def regenerate_image(self, image_id: str) -> Dict[str, Any]:
-        """Regenerate an existing image with the same settings."""
+        """Regenerate an existing image with the same settings.
+
+        The stored prompt is always passed back as custom_prompt, so a
+        regeneration never re-runs the Gemini Flash scene step; the original
+        prompt_source is carried over to the new image.
+        """
+        if not self.genai_client:
+            raise ValueError("Image generation not configured - check GEMINI_API_KEY")
+
         if not self.supabase:
             raise ValueError("Database not configured")
 
-        result = self.supabase.table("images").select("*").eq("id", image_id).single().execute()
+        # Embed the draft so regeneration needs a single lookup
+        result = await sb_execute(
+            self.supabase.table("images").select("*, drafts(*)").eq("id", image_id).single()
+        )
         image = result.data
 
         if not image:
             raise ValueError("Image not found")
 
-        return await self.generate_image(
+        draft = image.get("drafts")
+        if not draft:
+            raise ValueError("Draft not found")
+
+        return await self._generate_image_with_context(
             draft_id=image["draft_id"],
+            draft=draft,
+            brand_guidelines="",
             aspect_ratio=image["aspect_ratio"],
             style=image.get("style", "infographic"),
-            custom_prompt=image["prompt"]
+            custom_prompt=image["prompt"],
+            include_logo=True,
+            prompt_source=image.get("prompt_source") or "legacy",
+            scene_key=image.get("scene_key"),
+            created_at=None,
         )
@@ -2,10 +2,11 @@
 
 import os
 import sys
+import asyncio
 import logging
 from pathlib import Path
 from functools import lru_cache
-from typing import Optional
+from typing import Any, Optional
 
 from dotenv import load_dotenv
 from fastapi import FastAPI
@@ -27,6 +28,24 @@ elif _env_file.exists():
     load_dotenv(_env_file, override=True)
 
 
+# One handler shared by every logger from setup_logging
+_LOG_HANDLER = logging.StreamHandler()
+_LOG_HANDLER.setFormatter(
+    logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+)
+
+
+# Local dev frontend and this project's Vercel deployments: production
+# (content-automation-os.vercel.app) and previews, which Vercel names
+# content-automation-os-<hash or branch>-<team>.vercel.app. Credentials are
+# allowed, so other vercel.app sites must not match. Starlette compiles this
+# once; a wildcard in allow_origins is matched literally.
+CORS_ORIGIN_REGEX = (
+    r"^(https://content-automation-os(-[a-z0-9-]+)?\.vercel\.app"
+    r"|http://(localhost|127\.0\.0\.1):3000)$"
+)
+
+
 class Settings(BaseSettings):
     """Application settings loaded from environment variables."""
     
@@ -37,12 +56,16 @@ class Settings(BaseSettings):
     gemini_api_key: str = ""
     cron_secret: str = ""
     log_level: str = "INFO"
+
+    # Maximum concurrent Gemini image generations per process
+    image_max_concurrency: int = 4
     
     # OpenAI for image generation (legacy, kept for backward compatibility)
     openai_api_key: str = ""
     
     model_config = {
-        "extra": "ignore"
+        "extra": "ignore",
+        "frozen": True,
     }
     
     @property
@@ -74,9 +97,12 @@ def bootstrap(file_path: Path) -> None:
         sys.path.insert(0, str(api_python_dir))
 
 
+@lru_cache(maxsize=1)
 def init_supabase() -> Optional[Client]:
     """
-    Initialize and return Supabase client.
+    Initialize and return the shared Supabase client.
+    
+    Cached so every sub-app reuses one client and its connection pools.
     
     Returns:
         Supabase client instance or None if credentials not available.
@@ -96,6 +122,27 @@ def init_supabase() -> Optional[Client]:
     )
 
 
+async def sb_execute(query: Any) -> Any:
+    """
+    Execute a Supabase query in a worker thread.
+    
+    supabase-py is synchronous; running it on the event loop would block
+    every other request on this worker.
+    """
+    return await asyncio.to_thread(query.execute)
+
+
+def warm_caches() -> None:
+    """
+    Build the cached settings and Supabase client ahead of the first request.
+    
+    Call from the application's startup hook so cold starts pay for env
+    parsing and client construction during boot.
+    """
+    get_settings()
+    init_supabase()
+
+
 def setup_cors(app: FastAPI) -> None:
     """
     Configure CORS middleware for the FastAPI app.
@@ -103,17 +150,11 @@ def setup_cors(app: FastAPI) -> None:
     Args:
         app: FastAPI application instance
     """
-    origins = [
-        "http://localhost:3000",
-        "http://127.0.0.1:3000",
-        "https://*.vercel.app",
-    ]
-    
     app.add_middleware(
         CORSMiddleware,
-        allow_origins=origins,
+        allow_origin_regex=CORS_ORIGIN_REGEX,
         allow_credentials=True,
-        allow_methods=["*"],
+        allow_methods=["GET", "POST"],
         allow_headers=["*"],
     )
 
@@ -134,11 +175,6 @@ def setup_logging(name: str) -> logging.Logger:
     logger.setLevel(getattr(logging, settings.log_level.upper(), logging.INFO))
     
     if not logger.handlers:
-        handler = logging.StreamHandler()
-        formatter = logging.Formatter(
-            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-        )
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
+        logger.addHandler(_LOG_HANDLER)
     
     return logger
@@ -1,6 +1,6 @@
 """Pydantic models for content strategy API."""
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import Literal, Optional, List
 
 
@@ -32,6 +32,8 @@ class RecommendRequest(BaseModel):
 class ClassificationResult(BaseModel):
     """Result of a single post classification."""
 
+    model_config = ConfigDict(frozen=True)
+
     draft_id: str = Field(..., description="Draft ID")
     funnel_stage: FunnelStageType = Field(..., description="Classified funnel stage")
     confidence: float = Field(..., description="Classification confidence 0-1")
@@ -41,6 +43,8 @@ class ClassificationResult(BaseModel):
 class BatchClassificationResult(BaseModel):
     """Result of batch classification."""
 
+    model_config = ConfigDict(frozen=True)
+
     classified: int = Field(..., description="Number of posts classified")
     results: List[ClassificationResult] = Field(
         default_factory=list, description="Individual results"
@@ -80,6 +84,8 @@ class FunnelDistribution(BaseModel):
 class StrategyGap(BaseModel):
     """An identified gap in content strategy."""
 
+    model_config = ConfigDict(frozen=True)
+
     stage: FunnelStageType = Field(..., description="Funnel stage with gap")
     severity: Literal["low", "medium", "high"] = Field(
         ..., description="Gap severity"
@@ -90,6 +96,8 @@ class StrategyGap(BaseModel):
 class ContentRecommendation(BaseModel):
     """A specific content recommendation."""
 
+    model_config = ConfigDict(frozen=True)
+
     stage: FunnelStageType = Field(..., description="Target funnel stage")
     content_type: str = Field(..., description="Suggested content type/angle")
     title: str = Field(..., description="Suggested topic/title")
@@ -100,6 +108,8 @@ class ContentRecommendation(BaseModel):
 class PostIdea(BaseModel):
     """A concrete post idea."""
 
+    model_config = ConfigDict(frozen=True)
+
     stage: FunnelStageType = Field(..., description="Target funnel stage")
     platform: str = Field(..., description="Target platform")
     angle: str = Field(..., description="Content angle")
@@ -110,6 +120,8 @@ class PostIdea(BaseModel):
 class StrategyAnalysis(BaseModel):
     """AI analysis summary."""
 
+    model_config = ConfigDict(frozen=True)
+
     tofu_percentage: float = Field(0, description="TOFU percentage")
     mofu_percentage: float = Field(0, description="MOFU percentage")
     bofu_percentage: float = Field(0, description="BOFU percentage")
@@ -120,6 +132,8 @@ class StrategyAnalysis(BaseModel):
 class StrategyRecommendation(BaseModel):
     """Complete strategy recommendation response."""
 
+    model_config = ConfigDict(frozen=True)
+
     analysis: StrategyAnalysis = Field(
         default_factory=StrategyAnalysis, description="Distribution analysis"
     )
@@ -88,9 +88,6 @@ Analyze the current content distribution and provide strategic recommendations:
 Respond in JSON format:
 {{
     "analysis": {{
-        "tofu_percentage": 45,
-        "mofu_percentage": 35,
-        "bofu_percentage": 20,
         "balance_score": 8,
         "summary": "Brief overall assessment"
     }},
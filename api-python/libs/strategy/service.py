@@ -1,10 +1,15 @@
 """Content strategy service for funnel classification and recommendations."""
 
+import asyncio
+import hashlib
 import json
+from collections import Counter, defaultdict
 from datetime import datetime, timezone, timedelta
 from typing import Any, Optional, List, Dict
 
-from libs.setup import setup_logging
+from libs.cache import TTLCache
+from libs.common import parse_json_object
+from libs.setup import sb_execute, setup_logging
 from libs.strategy.prompts import (
     CLASSIFY_POST_PROMPT,
     CLASSIFY_BATCH_PROMPT,
@@ -27,6 +32,28 @@ logger = setup_logging(__name__)
 # Valid funnel stages
 VALID_STAGES = {"tofu", "mofu", "bofu"}
 
+# Classification prompts (single drafts or batch chunks) are sent to Gemini
+# concurrently, this many at a time per process
+MAX_CONCURRENT_CLASSIFICATIONS = 5
+
+# Post content is truncated in the database to what each prompt uses
+CLASSIFY_POST_MAX_CHARS = 2000
+CLASSIFY_BATCH_MAX_CHARS = 500
+CLASSIFY_BATCH_LIMIT = 50
+
+# Drafts per batch classification prompt
+CLASSIFY_BATCH_CHUNK_SIZE = 10
+
+# KB documents the recommendation prompt uses, and how long they are reused.
+# KB edits go through the Next.js API, which can't reach this cache, so a
+# change shows up in recommendations after at most this many seconds.
+CONTEXT_KEYS = ("tone_of_voice", "brand_guidelines")
+CONTEXT_CACHE_TTL_SECONDS = 60
+
+# Recommendations are reused while their inputs (distribution, period and
+# brand context) are unchanged
+RECOMMENDATION_CACHE_TTL_SECONDS = 3600
+
 
 class StrategyService:
     """Service for content strategy analysis and recommendations."""
@@ -38,123 +65,84 @@ class StrategyService:
     ):
         self.gemini = gemini_client
         self.supabase = supabase_client
+        self._classify_semaphore = asyncio.Semaphore(MAX_CONCURRENT_CLASSIFICATIONS)
+        self._context_cache: TTLCache[Dict[str, str]] = TTLCache(
+            maxsize=512, ttl=CONTEXT_CACHE_TTL_SECONDS
+        )
+        self._recommendation_cache: TTLCache[StrategyRecommendation] = TTLCache(
+            maxsize=256, ttl=RECOMMENDATION_CACHE_TTL_SECONDS
+        )
 
     async def classify_post(self, draft_id: str) -> ClassificationResult:
         """Classify a single draft by funnel stage."""
         if not self.gemini or not self.supabase:
             raise ValueError("Services not configured")
 
-        # Fetch the draft
-        result = (
-            self.supabase.table("drafts")
-            .select("id, content_text, platform")
-            .eq("id", draft_id)
-            .single()
-            .execute()
-        )
-        draft = result.data
-        if not draft:
-            raise ValueError("Draft not found")
-
-        prompt = CLASSIFY_POST_PROMPT.format(
-            platform=draft["platform"],
-            content=draft["content_text"][:2000],
-        )
-
-        response = self.gemini.generate_content(prompt)
-        parsed = self._parse_json_response(response.text)
-
-        stage = parsed.get("funnel_stage", "tofu")
-        if stage not in VALID_STAGES:
-            stage = "tofu"
-
-        confidence = float(parsed.get("confidence", 0.5))
-        reasoning = parsed.get("reasoning", "")
+        classification = await self._classify_draft(draft_id)
 
         # Update the draft in DB
-        self.supabase.table("drafts").update(
-            {"funnel_stage": stage}
-        ).eq("id", draft_id).execute()
-
-        return ClassificationResult(
-            draft_id=draft_id,
-            funnel_stage=stage,
-            confidence=confidence,
-            reasoning=reasoning,
+        await sb_execute(
+            self.supabase.table("drafts").update(
+                {"funnel_stage": classification.funnel_stage}
+            ).eq("id", draft_id)
         )
 
+        return classification
+
     async def classify_batch(self, workspace_id: str) -> List[ClassificationResult]:
         """Classify all untagged drafts in a workspace."""
         if not self.gemini or not self.supabase:
             raise ValueError("Services not configured")
 
         # Fetch unclassified drafts
-        result = (
-            self.supabase.table("drafts")
-            .select("id, content_text, platform")
-            .eq("workspace_id", workspace_id)
-            .is_("funnel_stage", "null")
-            .order("created_at", desc=True)
-            .limit(50)
-            .execute()
+        result = await sb_execute(
+            self.supabase.rpc(
+                "get_unclassified_drafts",
+                {
+                    "p_workspace_id": workspace_id,
+                    "p_limit": CLASSIFY_BATCH_LIMIT,
+                    "p_max_chars": CLASSIFY_BATCH_MAX_CHARS,
+                },
+            )
         )
         drafts = result.data or []
 
         if not drafts:
             return []
 
-        # For small batches, classify one by one for accuracy
+        # For small batches, classify one by one (concurrently) for accuracy
+        # and save all the stages together
         if len(drafts) <= 5:
-            results = []
-            for draft in drafts:
-                try:
-                    r = await self.classify_post(draft["id"])
-                    results.append(r)
-                except Exception as e:
-                    logger.error(f"Failed to classify draft {draft['id']}: {e}")
-            return results
-
-        # For larger batches, use batch prompt
-        posts_text = ""
-        for d in drafts:
-            posts_text += (
-                f"\n---\nID: {d['id']}\n"
-                f"Platform: {d['platform']}\n"
-                f"Content: {d['content_text'][:500]}\n"
+            outcomes = await asyncio.gather(
+                *(self._classify_draft(draft["id"]) for draft in drafts),
+                return_exceptions=True,
             )
+            classified: Dict[str, ClassificationResult] = {}
+            for draft, outcome in zip(drafts, outcomes):
+                if isinstance(outcome, Exception):
+                    logger.error(f"Failed to classify draft {draft['id']}: {outcome}")
+                else:
+                    classified[draft["id"]] = outcome
+            return await self._save_stages(workspace_id, classified)
+
+        # For larger batches, classify chunks of drafts per batch prompt,
+        # with the chunks running concurrently
+        chunks = [
+            drafts[i:i + CLASSIFY_BATCH_CHUNK_SIZE]
+            for i in range(0, len(drafts), CLASSIFY_BATCH_CHUNK_SIZE)
+        ]
+        outcomes = await asyncio.gather(
+            *(self._classify_chunk(chunk) for chunk in chunks),
+            return_exceptions=True,
+        )
+        classified = {}
+        for outcome in outcomes:
+            if isinstance(outcome, Exception):
+                logger.error(f"Failed to classify batch chunk: {outcome}")
+            else:
+                classified.update(outcome)
 
-        prompt = CLASSIFY_BATCH_PROMPT.format(posts=posts_text)
-        response = self.gemini.generate_content(prompt)
-        parsed = self._parse_json_response(response.text)
-
-        classifications = parsed.get("classifications", [])
-        results = []
-
-        for c in classifications:
-            draft_id = c.get("id", "")
-            stage = c.get("funnel_stage", "tofu")
-            if stage not in VALID_STAGES:
-                stage = "tofu"
-            confidence = float(c.get("confidence", 0.5))
-
-            # Update DB
-            try:
-                self.supabase.table("drafts").update(
-                    {"funnel_stage": stage}
-                ).eq("id", draft_id).execute()
-
-                results.append(
-                    ClassificationResult(
-                        draft_id=draft_id,
-                        funnel_stage=stage,
-                        confidence=confidence,
-                        reasoning=None,
-                    )
-                )
-            except Exception as e:
-                logger.error(f"Failed to update draft {draft_id}: {e}")
-
-        return results
+        return await self._save_stages(workspace_id, classified)
 
     async def get_distribution(
         self,
@@ -168,60 +156,34 @@ class StrategyService:
         # Build date filter
         date_filter = self._get_date_filter(time_period)
 
-        # Query drafts
-        query = (
-            self.supabase.table("drafts")
-            .select("funnel_stage, platform")
-            .eq("workspace_id", workspace_id)
+        # Counts per (platform, stage) across drafts and published posts,
+        # aggregated in the database
+        result = await sb_execute(
+            self.supabase.rpc(
+                "get_funnel_distribution",
+                {"p_workspace_id": workspace_id, "p_since": date_filter},
+            )
         )
-        if date_filter:
-            query = query.gte("created_at", date_filter)
+        rows = result.data or []
 
-        result = query.execute()
-        drafts = result.data or []
+        # Fold the rows into per-stage counters; anything that isn't a
+        # known stage counts as unclassified
+        totals: Counter = Counter()
+        platform_counts: Dict[str, Counter] = defaultdict(Counter)
 
-        # Also query published posts
-        pub_query = (
-            self.supabase.table("published_posts")
-            .select("funnel_stage, platform")
-            .eq("workspace_id", workspace_id)
-        )
-        if date_filter:
-            pub_query = pub_query.gte("published_at", date_filter)
-
-        pub_result = pub_query.execute()
-        published = pub_result.data or []
-
-        # Combine all posts
-        all_posts = drafts + published
-
-        # Compute totals
-        total = FunnelStageCounts()
-        platform_map: Dict[str, FunnelStageCounts] = {}
-
-        for post in all_posts:
-            stage = post.get("funnel_stage")
-            platform = post.get("platform", "unknown")
-
-            if platform not in platform_map:
-                platform_map[platform] = FunnelStageCounts()
-
-            if stage == "tofu":
-                total.tofu += 1
-                platform_map[platform].tofu += 1
-            elif stage == "mofu":
-                total.mofu += 1
-                platform_map[platform].mofu += 1
-            elif stage == "bofu":
-                total.bofu += 1
-                platform_map[platform].bofu += 1
-            else:
-                total.unclassified += 1
-                platform_map[platform].unclassified += 1
+        for row in rows:
+            stage = row.get("funnel_stage")
+            if stage not in VALID_STAGES:
+                stage = "unclassified"
+            count = row.get("post_count", 0)
+
+            totals[stage] += count
+            platform_counts[row.get("platform") or "unknown"][stage] += count
 
+        total = FunnelStageCounts(**totals)
         by_platform = [
-            PlatformDistribution(platform=p, counts=c)
-            for p, c in platform_map.items()
+            PlatformDistribution(platform=p, counts=FunnelStageCounts(**c))
+            for p, c in platform_counts.items()
         ]
 
         return FunnelDistribution(
@@ -242,36 +204,36 @@ class StrategyService:
         # Get current distribution
         distribution = await self.get_distribution(workspace_id, time_period)
 
-        total_classified = (
-            distribution.total.tofu
-            + distribution.total.mofu
-            + distribution.total.bofu
-        )
+        total = distribution.total
+        total_classified = total.tofu + total.mofu + total.bofu
+
+        # Build distribution text; the percentages are computed here once and
+        # reported as-is rather than trusting the model to echo them back
+        tofu_pct = self._percentage(total.tofu, total_classified)
+        mofu_pct = self._percentage(total.mofu, total_classified)
+        bofu_pct = self._percentage(total.bofu, total_classified)
 
-        # Build distribution text
         if total_classified == 0:
             dist_text = "No classified posts yet. All posts are unclassified."
         else:
             dist_text = (
                 f"Total classified posts: {total_classified}\n"
-                f"- TOFU (Awareness): {distribution.total.tofu} "
-                f"({round(distribution.total.tofu / total_classified * 100)}%)\n"
-                f"- MOFU (Consideration): {distribution.total.mofu} "
-                f"({round(distribution.total.mofu / total_classified * 100)}%)\n"
-                f"- BOFU (Conversion): {distribution.total.bofu} "
-                f"({round(distribution.total.bofu / total_classified * 100)}%)\n"
-                f"- Unclassified: {distribution.total.unclassified}"
+                f"- TOFU (Awareness): {total.tofu} ({tofu_pct}%)\n"
+                f"- MOFU (Consideration): {total.mofu} ({mofu_pct}%)\n"
+                f"- BOFU (Conversion): {total.bofu} ({bofu_pct}%)\n"
+                f"- Unclassified: {total.unclassified}"
             )
 
         # Build platform breakdown
-        platform_text = ""
+        parts = []
         for pd in distribution.by_platform:
             plat_total = pd.counts.tofu + pd.counts.mofu + pd.counts.bofu
-            platform_text += (
+            parts.append(
                 f"\n{pd.platform.upper()}: "
                 f"TOFU={pd.counts.tofu}, MOFU={pd.counts.mofu}, "
                 f"BOFU={pd.counts.bofu} (total={plat_total})"
             )
+        platform_text = "".join(parts)
 
         if not platform_text:
             platform_text = "No platform-specific data available."
@@ -287,15 +249,28 @@ class StrategyService:
             brand_guidelines=context.get("brand_guidelines", "Not specified"),
         )
 
-        response = self.gemini.generate_content(prompt)
+        # Keyed on the full distribution (unclassified counts included, which
+        # the prompt can leave out) so cached results never show stale counts
+        cache_key = hashlib.blake2b(
+            json.dumps(
+                [workspace_id, time_period, distribution.model_dump_json(), context],
+                sort_keys=True,
+            ).encode(),
+            digest_size=16,
+        ).hexdigest()
+        cached = self._recommendation_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        response = await self.gemini.generate_content_async(prompt)
         parsed = self._parse_json_response(response.text)
 
         # Build response — safely handle unpredictable LLM output
         analysis_data = parsed.get("analysis", {})
-        analysis = StrategyAnalysis(
-            tofu_percentage=self._safe_float(analysis_data.get("tofu_percentage"), 0),
-            mofu_percentage=self._safe_float(analysis_data.get("mofu_percentage"), 0),
-            bofu_percentage=self._safe_float(analysis_data.get("bofu_percentage"), 0),
+        analysis = StrategyAnalysis.model_construct(
+            tofu_percentage=float(tofu_pct),
+            mofu_percentage=float(mofu_pct),
+            bofu_percentage=float(bofu_pct),
             balance_score=self._safe_int(analysis_data.get("balance_score"), 5),
             summary=str(analysis_data.get("summary", "")),
         )
@@ -308,92 +283,186 @@ class StrategyService:
             severity = g.get("severity", "medium")
             if severity not in valid_severities:
                 severity = "medium"
-            try:
-                gaps.append(StrategyGap(
-                    stage=g["stage"],
-                    severity=severity,
-                    description=str(g.get("description", "")),
-                ))
-            except Exception as e:
-                logger.warning(f"Skipping malformed gap entry: {e}")
+            gaps.append(StrategyGap.model_construct(
+                stage=g["stage"],
+                severity=severity,
+                description=str(g.get("description", "")),
+            ))
 
         recommendations = []
         for r in parsed.get("recommendations", []):
             if r.get("stage") not in VALID_STAGES:
                 continue
-            try:
-                recommendations.append(ContentRecommendation(
-                    stage=r["stage"],
-                    content_type=str(r.get("content_type", "")),
-                    title=str(r.get("title", "")),
-                    description=str(r.get("description", "")),
-                    platform=str(r.get("platform", "linkedin")),
-                ))
-            except Exception as e:
-                logger.warning(f"Skipping malformed recommendation entry: {e}")
+            recommendations.append(ContentRecommendation.model_construct(
+                stage=r["stage"],
+                content_type=str(r.get("content_type", "")),
+                title=str(r.get("title", "")),
+                description=str(r.get("description", "")),
+                platform=str(r.get("platform", "linkedin")),
+            ))
 
         post_ideas = []
         for p in parsed.get("post_ideas", []):
             if p.get("stage") not in VALID_STAGES:
                 continue
-            try:
-                post_ideas.append(PostIdea(
-                    stage=p["stage"],
-                    platform=str(p.get("platform", "linkedin")),
-                    angle=str(p.get("angle", "")),
-                    hook=str(p.get("hook", "")),
-                    outline=str(p.get("outline", "")),
-                ))
-            except Exception as e:
-                logger.warning(f"Skipping malformed post idea entry: {e}")
-
-        return StrategyRecommendation(
+            post_ideas.append(PostIdea.model_construct(
+                stage=p["stage"],
+                platform=str(p.get("platform", "linkedin")),
+                angle=str(p.get("angle", "")),
+                hook=str(p.get("hook", "")),
+                outline=str(p.get("outline", "")),
+            ))
+
+        recommendation = StrategyRecommendation(
             analysis=analysis,
             gaps=gaps,
             recommendations=recommendations,
             post_ideas=post_ideas,
             distribution=distribution,
         )
+        self._recommendation_cache[cache_key] = recommendation
+        return recommendation
+
+    async def _classify_draft(self, draft_id: str) -> ClassificationResult:
+        """Ask Gemini for a draft's funnel stage without saving it."""
+        # Fetch the draft
+        result = await sb_execute(
+            self.supabase.rpc(
+                "get_draft_for_classification",
+                {"p_draft_id": draft_id, "p_max_chars": CLASSIFY_POST_MAX_CHARS},
+            )
+        )
+        draft = result.data
+        if not draft:
+            raise ValueError("Draft not found")
+
+        prompt = CLASSIFY_POST_PROMPT.format(
+            platform=draft["platform"],
+            content=draft["content_text"],
+        )
+
+        async with self._classify_semaphore:
+            response = await self.gemini.generate_content_async(prompt)
+        parsed = self._parse_json_response(response.text)
+
+        stage = parsed.get("funnel_stage", "tofu")
+        if stage not in VALID_STAGES:
+            stage = "tofu"
+
+        confidence = float(parsed.get("confidence", 0.5))
+        reasoning = str(parsed.get("reasoning") or "")
+
+        return ClassificationResult.model_construct(
+            draft_id=draft_id,
+            funnel_stage=stage,
+            confidence=confidence,
+            reasoning=reasoning,
+        )
+
+    async def _classify_chunk(
+        self, drafts: List[Dict[str, Any]]
+    ) -> Dict[str, ClassificationResult]:
+        """Classify several drafts with one batch prompt, keyed by draft id."""
+        parts = []
+        for d in drafts:
+            parts.append(
+                f"\n---\nID: {d['id']}\n"
+                f"Platform: {d['platform']}\n"
+                f"Content: {d['content_text']}\n"
+            )
+        posts_text = "".join(parts)
+
+        prompt = CLASSIFY_BATCH_PROMPT.format(posts=posts_text)
+        async with self._classify_semaphore:
+            response = await self.gemini.generate_content_async(prompt)
+        parsed = self._parse_json_response(response.text)
+
+        classifications = parsed.get("classifications", [])
+
+        # Keep one entry per fetched draft so a stray or malformed id from
+        # the model can't fail the bulk update
+        draft_ids = {d["id"] for d in drafts}
+        classified: Dict[str, ClassificationResult] = {}
+
+        for c in classifications:
+            draft_id = c.get("id", "")
+            if draft_id not in draft_ids:
+                continue
+            stage = c.get("funnel_stage", "tofu")
+            if stage not in VALID_STAGES:
+                stage = "tofu"
+
+            try:
+                classified[draft_id] = ClassificationResult.model_construct(
+                    draft_id=draft_id,
+                    funnel_stage=stage,
+                    confidence=float(c.get("confidence", 0.5)),
+                    reasoning=None,
+                )
+            except Exception as e:
+                logger.warning(f"Skipping malformed classification for draft {draft_id}: {e}")
+
+        return classified
+
+    async def _save_stages(
+        self,
+        workspace_id: str,
+        classified: Dict[str, ClassificationResult],
+    ) -> List[ClassificationResult]:
+        """Write classified stages in one round-trip; return the saved results."""
+        if not classified:
+            return []
+
+        try:
+            updated = await sb_execute(
+                self.supabase.rpc(
+                    "update_funnel_stages",
+                    {
+                        "p_workspace_id": workspace_id,
+                        "p_stages": [
+                            {"id": r.draft_id, "funnel_stage": r.funnel_stage}
+                            for r in classified.values()
+                        ],
+                    },
+                )
+            )
+        except Exception as e:
+            logger.error(f"Failed to update funnel stages for workspace {workspace_id}: {e}")
+            return []
+
+        updated_ids = set(updated.data or [])
+        return [r for r in classified.values() if r.draft_id in updated_ids]
 
     async def _fetch_context(self, workspace_id: str) -> Dict[str, str]:
-        """Fetch brand context documents."""
+        """Fetch brand context documents, cached per workspace."""
         if not self.supabase:
             return {}
 
+        cached = self._context_cache.get(workspace_id)
+        if cached is not None:
+            return cached
+
         context = {}
-        result = (
+        result = await sb_execute(
             self.supabase.table("kb_documents")
             .select("key, content_md")
             .eq("workspace_id", workspace_id)
             .eq("is_active", True)
-            .execute()
+            .in_("key", CONTEXT_KEYS)
         )
 
         for doc in result.data or []:
-            key = doc.get("key", "")
-            if key == "tone_of_voice":
-                context["tone_of_voice"] = doc.get("content_md", "")
-            elif key == "brand_guidelines":
-                context["brand_guidelines"] = doc.get("content_md", "")
+            context[doc["key"]] = doc.get("content_md", "")
 
+        self._context_cache[workspace_id] = context
         return context
 
     @staticmethod
-    def _safe_float(value: Any, default: float = 0.0) -> float:
-        """Safely convert LLM output to float."""
-        if value is None:
-            return default
-        try:
-            return float(value)
-        except (ValueError, TypeError):
-            # Handle strings like "45%" or "8/10"
-            if isinstance(value, str):
-                cleaned = value.replace("%", "").strip()
-                try:
-                    return float(cleaned)
-                except (ValueError, TypeError):
-                    pass
-            return default
+    def _percentage(count: int, total: int) -> int:
+        """Whole-number share of total, rounded half up (0 when total is 0)."""
+        if not total:
+            return 0
+        return (count * 100 + total // 2) // total
 
     @staticmethod
     def _safe_int(value: Any, default: int = 0) -> int:
@@ -424,13 +493,9 @@ class StrategyService:
         return None
 
     def _parse_json_response(self, text: str) -> Dict[str, Any]:
-        """Parse JSON from LLM response."""
+        """Parse JSON from LLM response (see parse_json_object)."""
         try:
-            start = text.find("{")
-            end = text.rfind("}") + 1
-            if start >= 0 and end > start:
-                json_str = text[start:end]
-                return json.loads(json_str)
+            return parse_json_object(text)
         except json.JSONDecodeError as e:
             logger.warning(f"Failed to parse JSON response: {e}")
         return {}
@@ -1,5 +1,8 @@
 """Main FastAPI application that mounts all sub-applications."""
 
+import asyncio
+import importlib
+from contextlib import asynccontextmanager
 from pathlib import Path
 import sys
 
@@ -7,39 +10,93 @@ import sys
 sys.path.insert(0, str(Path(__file__).parent))
 
 from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
 
-from libs.setup import setup_logging
-
-# Import sub-applications
-from api.enrichment.index import app as enrichment_app
-from api.generation.index import app as generation_app
-from api.images.index import app as images_app
-from api.strategy.index import app as strategy_app
+from libs.setup import setup_cors, setup_logging, warm_caches
 
 logger = setup_logging(__name__)
 
+
+class LazyApp:
+    """ASGI app that imports a sub-application on its first request.
+
+    Keeps the sub-apps' heavy imports (Gemini, Supabase, Pillow, ...) out of
+    process start-up.
+    """
+
+    def __init__(self, module_name: str):
+        self.module_name = module_name
+        self.module = None
+        self._lock = asyncio.Lock()
+
+    def load(self):
+        """Import the sub-app module (once) and return it."""
+        if self.module is None:
+            self.module = importlib.import_module(self.module_name)
+        return self.module
+
+    async def load_async(self):
+        """Import the sub-app module (once) in a worker thread and return it.
+
+        Keeps the import off the event loop; the lock makes concurrent first
+        callers share one import.
+        """
+        if self.module is None:
+            async with self._lock:
+                if self.module is None:
+                    await asyncio.to_thread(self.load)
+        return self.module
+
+    async def __call__(self, scope, receive, send):
+        module = await self.load_async()
+        await module.app(scope, receive, send)
+
+
+# Sub-applications, imported on first use
+enrichment_app = LazyApp("api.enrichment.index")
+generation_app = LazyApp("api.generation.index")
+images_app = LazyApp("api.images.index")
+strategy_app = LazyApp("api.strategy.index")
+
+
+async def _warm_images() -> None:
+    """Import the images sub-app off the event loop and warm its service.
+
+    The images app is the one whose first request is slowest (Pillow, the
+    logo and a Gemini handshake), so it is loaded in the background at
+    startup on purpose; the other sub-apps stay lazy.
+    """
+    try:
+        module = await images_app.load_async()
+        await module.image_service.warmup()
+    except Exception as e:
+        logger.warning(f"Image service warmup failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm up services in the background and release their connections after.
+
+    Mounted sub-apps don't get lifespan events, so this covers them. Image
+    warmup runs alongside serving so it doesn't delay the first request.
+    """
+    warm_caches()
+    warmup = asyncio.create_task(_warm_images())
+    yield
+    warmup.cancel()
+    if images_app.module is not None:
+        await images_app.module.image_service.aclose()
+
+
 # Create main app
 app = FastAPI(
     title="Content Automation Hub API",
     description="Backend API for content generation and management",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS
-origins = [
-    "http://localhost:3000",
-    "http://127.0.0.1:3000",
-    "https://*.vercel.app",
-]
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+setup_cors(app)
 
 # Mount sub-applications
 app.mount("/api/enrichment", enrichment_app)
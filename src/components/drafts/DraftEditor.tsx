@@ -723,7 +723,7 @@ export function DraftEditor({ draft, onUpdate, onClose }: DraftEditorProps) {
                           const url = URL.createObjectURL(blob);
                           const a = document.createElement('a');
                           a.href = url;
-                          a.download = `image-${selectedImage.id}.png`;
+                          a.download = `image-${selectedImage.id}.${selectedImage.storage_path.split('.').pop() || 'png'}`;
                           a.click();
                           URL.revokeObjectURL(url);
                           toast.success('Image downloaded!');
@@ -134,6 +134,7 @@ export interface GeneratedImage {
   storage_path: string;
   aspect_ratio: '1:1' | '16:9' | '9:16' | '4:5';
   style?: string;
+  prompt_source?: 'scene' | 'user' | 'legacy';
   created_at: string;
 }
 
@@ -0,0 +1,7 @@
+-- Record where each image's prompt came from
+-- 'scene'  = scene brief written by Gemini Flash
+-- 'user'   = custom prompt supplied by the caller
+-- 'legacy' = images created before this column existed
+
+ALTER TABLE images ADD COLUMN IF NOT EXISTS prompt_source TEXT NOT NULL DEFAULT 'legacy'
+  CHECK (prompt_source IN ('scene', 'user', 'legacy'));
@@ -0,0 +1,7 @@
+-- Key Gemini Flash scene briefs by (style, post content, brand guidelines)
+-- so any worker can reuse a brief the workspace generated earlier instead of
+-- re-running Flash
+
+ALTER TABLE images ADD COLUMN IF NOT EXISTS scene_key TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_images_workspace_scene_key ON images(workspace_id, scene_key);
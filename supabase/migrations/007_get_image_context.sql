@@ -0,0 +1,19 @@
+-- Return a draft together with its workspace's active brand guidelines so
+-- image generation fetches both in one round-trip instead of two
+
+CREATE OR REPLACE FUNCTION get_image_context(p_draft_id UUID)
+RETURNS JSON AS $$
+  SELECT json_build_object(
+    'draft', to_json(d),
+    'brand_guidelines', (
+      SELECT k.content_md
+      FROM kb_documents k
+      WHERE k.workspace_id = d.workspace_id
+        AND k.key = 'brand_guidelines'
+        AND k.is_active
+      LIMIT 1
+    )
+  )
+  FROM drafts d
+  WHERE d.id = p_draft_id;
+$$ LANGUAGE sql STABLE;
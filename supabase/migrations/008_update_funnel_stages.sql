@@ -0,0 +1,12 @@
+-- Write a batch of funnel stage classifications in one statement instead of
+-- one UPDATE per draft. Returns the ids that were actually updated.
+
+CREATE OR REPLACE FUNCTION update_funnel_stages(p_workspace_id UUID, p_stages JSONB)
+RETURNS SETOF UUID AS $$
+  UPDATE drafts d
+  SET funnel_stage = v.funnel_stage::funnel_stage
+  FROM jsonb_to_recordset(p_stages) AS v(id UUID, funnel_stage TEXT)
+  WHERE d.id = v.id
+    AND d.workspace_id = p_workspace_id
+  RETURNING d.id;
+$$ LANGUAGE sql VOLATILE;
@@ -0,0 +1,24 @@
+-- Count drafts and published posts per (platform, funnel stage) in the
+-- database so the strategy API receives a few aggregate rows instead of
+-- every post in the workspace
+
+CREATE OR REPLACE FUNCTION get_funnel_distribution(
+  p_workspace_id UUID,
+  p_since TIMESTAMPTZ DEFAULT NULL
+)
+RETURNS TABLE (platform TEXT, funnel_stage TEXT, post_count BIGINT) AS $$
+  SELECT s.platform::TEXT, s.funnel_stage::TEXT, COUNT(*)
+  FROM (
+    SELECT d.platform, d.funnel_stage
+    FROM drafts d
+    WHERE d.workspace_id = p_workspace_id
+      AND (p_since IS NULL OR d.created_at >= p_since)
+    UNION ALL
+    SELECT p.platform, p.funnel_stage
+    FROM published_posts p
+    WHERE p.workspace_id = p_workspace_id
+      AND (p_since IS NULL OR p.published_at >= p_since)
+  ) s
+  GROUP BY s.platform, s.funnel_stage
+  ORDER BY s.platform;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,31 @@
+-- Return drafts for funnel classification with content_text already cut to
+-- the length the prompt uses, so full posts aren't sent to the API only to
+-- be truncated there
+
+CREATE OR REPLACE FUNCTION get_draft_for_classification(
+  p_draft_id UUID,
+  p_max_chars INT
+)
+RETURNS JSON AS $$
+  SELECT json_build_object(
+    'id', d.id,
+    'platform', d.platform,
+    'content_text', COALESCE(LEFT(d.content_text, p_max_chars), '')
+  )
+  FROM drafts d
+  WHERE d.id = p_draft_id;
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION get_unclassified_drafts(
+  p_workspace_id UUID,
+  p_limit INT,
+  p_max_chars INT
+)
+RETURNS TABLE (id UUID, platform TEXT, content_text TEXT) AS $$
+  SELECT d.id, d.platform::TEXT, COALESCE(LEFT(d.content_text, p_max_chars), '')
+  FROM drafts d
+  WHERE d.workspace_id = p_workspace_id
+    AND d.funnel_stage IS NULL
+  ORDER BY d.created_at DESC
+  LIMIT p_limit;
+$$ LANGUAGE sql STABLE;
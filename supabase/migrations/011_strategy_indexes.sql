@@ -0,0 +1,16 @@
+-- Indexes for the content strategy queries
+
+-- get_unclassified_drafts: newest untagged drafts in a workspace
+CREATE INDEX IF NOT EXISTS idx_drafts_unclassified
+  ON drafts(workspace_id, created_at DESC)
+  WHERE funnel_stage IS NULL;
+
+-- get_funnel_distribution: posts in a workspace since a date, counted by
+-- platform and stage (covered, so both halves can use index-only scans)
+CREATE INDEX IF NOT EXISTS idx_drafts_workspace_created
+  ON drafts(workspace_id, created_at)
+  INCLUDE (platform, funnel_stage);
+
+CREATE INDEX IF NOT EXISTS idx_published_posts_workspace_published
+  ON published_posts(workspace_id, published_at)
+  INCLUDE (platform, funnel_stage);